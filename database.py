@@ -6,6 +6,8 @@ import os
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 # # Fetch credentials from environment variables
 api_token = os.getenv("API_TOKEN")
@@ -19,7 +21,16 @@ warehouse_id = os.getenv("WAREHOUSE_ID")
 CATALOG = "hive_metastore"
 SCHEMA = "Purchase"
 
-logging.info(f"Using Databricks host: {host}")
+# Connection pool sizing so concurrent agent tool calls each get their own connection;
+# connections are checked on checkout and recycled before the server drops them as idle
+ENGINE_ARGS = {
+    "pool_size": 20,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
+logger.info(f"Using Databricks host: {host}")
 
 class SingletonSQLDatabase:
     """Thread-safe Singleton for managing a shared SQLDatabase instance."""
@@ -31,7 +42,7 @@ class SingletonSQLDatabase:
         if not cls._instance:
             with cls._lock:
                 if not cls._instance:  # Double-check for thread safety
-                    logging.info("Initializing SQLDatabase instance...")
+                    logger.info("Initializing SQLDatabase instance...")
                     cls._instance = cls._initialize_instance()
         return cls._instance
 
@@ -44,9 +55,10 @@ class SingletonSQLDatabase:
                 api_token=api_token,
                 host=host,
                 warehouse_id=warehouse_id,
+                engine_args=ENGINE_ARGS,
             )
         except Exception as e:
-            logging.error("Failed to initialize SQLDatabase:", exc_info=True)
+            logger.error("Failed to initialize SQLDatabase:", exc_info=True)
             raise RuntimeError("Failed to initialize SQLDatabase") from e
 
     @classmethod
@@ -1,18 +1,26 @@
 import re
+import copy
+import hashlib
 import logging
-from fastapi import FastAPI, HTTPException, Depends
+import queue
+from logging.handlers import QueueHandler, QueueListener
+import httpx
+import redis.asyncio as redis
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from typing import Dict
-from langchain_openai import ChatOpenAI
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder
-from langchain_core.messages import AIMessage, SystemMessage
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder, SystemMessagePromptTemplate
+from langchain_core.messages import SystemMessage
 from langchain_community.utilities.sql_database import SQLDatabase
 from database import SingletonSQLDatabase  # Import the Singleton connection instance
 from custom_datatypes import ModelInput
+from sql_tools import InvoiceSQLDatabaseToolkit
+from metadata_router import MetadataRouter, split_metadata_groups
+from response_cache import RedisResponseCache, ResponseCache, SIMILARITY_HIT, SIMILARITY_VERIFY
 from langchain_community.agent_toolkits.sql.base import create_sql_agent
-from apscheduler.schedulers.background import BackgroundScheduler
-import threading
 from dotenv import load_dotenv
+from pythonjsonlogger import jsonlogger
 import os
 load_dotenv()
 
@@ -21,352 +29,380 @@ load_dotenv()
 
 openai_api_key = os.getenv("openai_api_key")
 
-
-# Initialize FastAPI application
-app = FastAPI()
-
-# Function to keep the database connection alive
-def keep_connection_alive():
+# Optional Redis URL for sharing the response cache across workers
+redis_url = os.getenv("REDIS_URL")
+
+# Cached answers in every tier expire after this many seconds
+CACHE_TTL = 3600
+
+# Seconds before an OpenAI request is abandoned
+OPENAI_TIMEOUT = 60
+
+# Models used for answering and for embedding questions
+LLM_MODEL = "gpt-4o"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Seconds before a Redis call is abandoned and treated as a cache miss
+REDIS_TIMEOUT = 1
+
+# JSON logs; records are queued and formatted and written by a listener thread, so the
+# event loop only enqueues them. LOG_LEVEL=DEBUG also includes tracebacks on errors.
+class _UnformattedQueueHandler(QueueHandler):
+    """QueueHandler that keeps exc_info so the listener's formatter renders tracebacks."""
+
+    def prepare(self, record):
+        # The stock prepare() formats the record, traceback included, on the caller's thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(jsonlogger.JsonFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+log_listener = QueueListener(_log_queue, _log_handler)
+# Accept level names in any case; anything unrecognized falls back to WARNING
+_log_level = os.getenv("LOG_LEVEL", "WARNING").upper()
+if not isinstance(logging.getLevelName(_log_level), int):
+    _log_level = "WARNING"
+# force=True replaces any handler an earlier logging call installed implicitly
+logging.basicConfig(level=_log_level, handlers=[_UnformattedQueueHandler(_log_queue)], force=True)
+log_listener.start()
+
+logger = logging.getLogger(__name__)
+
+# SQL dialect of the SingletonSQLDatabase backend and the default row limit for agent queries
+DIALECT = "databricks"
+TOP_K = 30
+
+# Prompt building blocks, built once at import time and shared by every request
+METADATA_GROUPINGS = """
+**Description:**
+This table contains cleansed and structured item data for equipment and parts used in various systems. It provides detailed information on item descriptions, specifications, manufacturer details, and unique identifiers to ensure accurate item tracking and data integrity.
+
+**Columns Metadata:**
+
+### Metadata Groupings
+
+#### Vessel Details:
+- **vessel_id**: Unique identifier for the vessel.
+- **vessel_object_id**: Internal object identifier for the vessel in the system.
+- **Vessel_Name**: Name of the vessel associated with the purchase order or invoice.
+
+#### Invoice Details:
+- **Invoice_Id**: Unique identifier for the invoice.
+- **Inv_Title**: Title or description of the invoice.
+- **Inv_Code**: Unique code assigned to the invoice.
+- **VENDOR_INVOICE_DATE**: Date the vendor issued the invoice.
+- **INVOICE_CURRENCY_ID**: Unique identifier for the currency used in the invoice.
+- **Invoice_Currency_Name**: Name of the currency used in the invoice (e.g., US Dollar, Euro).
+- **Invoice_Currency_Code**: ISO currency code (e.g., USD, EUR) for the invoice.
+- **EXG_RATE_VESSEL_CURRENCY**: Exchange rate to convert the invoice currency into the vessel's operating currency.
+- **EXG_RATE_GROUP_CURRENCY**: Exchange rate to convert the invoice currency into the group's base currency.
+- **REGISTRATION_DATE**: Date the invoice was registered in the system.
+- **inv_approval_flag**: Indicates if the invoice has been approved (1 for approved, 0 for pending).
+- **CASH_PO_INVOICE**: Indicates if the invoice is linked to a cash-based purchase order.
+- **VENDOR_INVOICE_NO**: Unique number assigned to the invoice by the vendor.
+- **PARTIAL_INVOICE**: Indicates if the invoice is a partial payment or installment (1 for partial).
+- **PAID_ADV**: Amount of advance payment made against the invoice.
+- **INVOICE_TYPE**: Type of invoice (e.g., Regular, Credit, Debit).
+- **VAT_AMOUNT**: Value-added tax applied to the invoice.
+- **INVOICE_AMOUNT**: Total amount of the invoice.
+- **CASH_DISCOUNT**: Discount applied for early payment in cash.
+- **PAY_DUE_DATE**: Due date for payment of the invoice.
+- **INVOICE_YEAR**: Year the invoice was issued.
+- **PAYMENT_DATE**: Date the invoice was paid.
+- **Inv_Dt_Id**: Unique identifier for the invoice date.
+- **Inv_Effective_Date**: Date when the invoice became effective (e.g., for accounting purposes).
+- **Inv_Closed_Date**: Date the invoice was marked as closed.
+- **total_invoice_currency**: Total invoice amount in the original invoice currency.
+
+#### Purchase Order Details:
+- **po_hd_Id**: Unique identifier for the purchase order header.
+- **po_code**: Code for the purchase order.
+- **created_date**: Date the purchase order was created.
+- **po_dt_id**: Unique identifier for the purchase order details.
+- **po_id**: Unique identifier for the purchase order.
+- **po_quantity**: Quantity of items in the purchase order.
+- **po_unit_price**: Unit price of items in the purchase order.
+- **po_account_id**: Account identifier for the purchase order.
+- **effective_date**: Effective date of the purchase order.
+- **closed_date**: Date the purchase order was marked as closed.
+- **lead_days**: Lead time in days for the purchase order.
+
+#### Requisition and Approval Details:
+- **requisition_dt_id**: Unique identifier for the requisition details.
+- **enquiry_dt_id**: Unique identifier for the enquiry details.
+- **quote_dt_id**: Unique identifier for the quote details.
+- **approved_quote_dt_id**: Unique identifier for the approved quote details.
+- **approval_list_id**: Unique identifier for the approval list.
+
+#### Goods Receipt Note (GRN) Details:
+- **sp_goods_receipt_id**: Unique identifier for the goods receipt note.
+- **sp_goods_receipt_hd_code**: Header code for the goods receipt note.
+- **grn_receipt_date**: Date the goods receipt was created.
+- **grn_receipt_status**: Status of the goods receipt (e.g., Pending, Approved).
+- **vendor_delivery_reference**: Vendor’s reference for the delivery associated with the invoice.
+- **grn_remarks**: Remarks or notes about the goods receipt.
+- **send_to_office**: Indicates whether the goods receipt is sent to the office.
+- **goods_rcvd_approved_date**: Date the received goods were approved.
+- **sp_goods_receipt_dt_id**: Unique identifier for the goods receipt date.
+
+#### Item and Quantity Details:
+- **item_id**: Unique identifier for the item being purchased or invoiced.
+- **uom_id**: Unit of measure for the item (e.g., KG, LTR, PCS).
+- **received_qty**: Quantity of goods received from the vendor.
+- **accepted_qty**: Quantity of goods accepted after inspection.
+- **converted_stock_qty**: Quantity of goods added to inventory after conversion or repackaging.
+- **normal_qty**: Standard quantity for the item in inventory.
+- **reconditioned_qty**: Quantity of goods reconditioned for use.
+
+#### Port Details:
+- **port_id**: Unique identifier for the port.
+- **port_name**: Name of the port.
+- **port_code**: Code representing the port (e.g., for internal or system use).
+- **port_unloccode**: UN/LOCODE for the port, used for international trade and transport.
+- **ai_port_unloc_id**: AI-enhanced identifier combining the UN/LOCODE with system-specific details.
+
+#### Financial Details:
+- **QUANTITY**: Quantity of the item involved in the transaction.
+- **UNIT_PRICE**: Unit price of the item involved in the transaction.
+- **ACCOUNT_ID**: Identifier for the account linked to the transaction.
+- **ENTITY_ID**: Unique identifier for the entity associated with the transaction.
+- **TOTAL_VESSEL_CURRENCY**: Total amount in the vessel's operating currency.
+- **TOTAL_PO_CURRENCY**: Total amount in the purchase order's currency.
+- **TOTAL_GROUP_CURRENCY**: Total amount in the group's base currency.
+- **Inv_Account_Code**: Code representing the account linked to the invoice.
+- **Inv_Account_Name**: Name of the account linked to the invoice.
+
+#### Vendor Details:
+- **Vendor**: Name of the vendor associated with the invoice.
+- **Vendor_ID**: Unique identifier for the vendor.
+- **Account_Number**: Account number associated with the vendor.
+- **BANK_CODE**: Code of the bank where the vendor holds an account.
+- **SWIFT_CODE**: SWIFT code for the vendor's bank.
+- **IBAN**: IBAN (International Bank Account Number) for the vendor.
+
+"""
+
+PREFIX = """
+You are an advanced SQL database assistant specializing in answering user queries by interacting with the `Vw_Ai_Tbl_PO_PurchaseOrders_Invoices_Details` table in the `Common` schema.
+### Responsibilities:
+1. Provide **precise** and **contextually relevant** answers strictly based on the specified table and schema.
+2. Ensure **query normalization and standardization** to deliver consistent and meaningful results for similar questions.
+3. Leverage response history to avoid redundant queries, optimizing efficiency and user satisfaction.
+
+### Query Normalization Guidelines:
+- **String Functions**:
+1.Use SQL string functions like `LOWER()`, `TRIM()`, `REPLACE()`, and fuzzy matching (`LIKE`, `LEVENSHTEIN()`, `SOUNDEX`) to account for minor spelling errors or variations.
+- **Case Mismatch Handling**:
+1.If the data in the database is stored in a specific case (e.g., uppercase), ensure that both the input and the database column are transformed to the same case during processing.
+- **For consistent matching**: 
+1.Normalize input to match the stored case (e.g., UPPER() for uppercase or LOWER() for lowercase).
+2.Apply the same transformation on both sides of the comparison.
+3.Use case-insensitive comparisons (e.g., ILIKE for PostgreSQL, collations in MySQL).
+### SQL Query Construction:
+1. Ensure the query adheres to the **{dialect} dialect** syntax.
+2. Use **specific columns** in the SELECT clause for precision; avoid `SELECT *`.
+3. Queries without a `LIMIT` are capped at **{top_k}** rows automatically; add a `LIMIT` only when the user asks for a different number of results.
+4. Order results by **relevant columns** for clarity (e.g., `ApprovedDate DESC` for recent approvals).
+5. Validate query syntax before execution to ensure success and eliminate errors.
+6. Incorporate conditions for **filtering by user intent** and domain-specific logic (e.g., fetching purchase orders for a particular `VesselName` or `SMC`).
+7. When queried regarding **unique vendors**, the unique vendors are supposed to be calculated based on  **VENDOREMAIL**
+8. Use the **PO_USD_VALUE** column for the questions regarding the purchase.
+### Rules of Engagement:
+- Do not perform Data Manipulation Language (DML) operations such as `INSERT`, `UPDATE`, or `DELETE`.
+- Use **Markdown format** for presenting results:
+  - Include bordered tables for tabular data for better readability.
+- If the query is unrelated to the database or cannot be addressed, respond with:
+  *"I'm unable to provide an answer for that. This information is not available."*
+- Handle ambiguous questions by:
+  1. Politely clarifying the user's intent.
+  2. Assuming the most logical interpretation when clarification isn't feasible.
+- **Tone and Style**:
+  - Be professional, concise, and courteous in responses.
+  - Avoid database-specific jargon unless directly relevant.
+  - Use the column metadata provided below.
+
+Your ultimate goal is to ensure clarity, accuracy, and user satisfaction while adhering strictly to data access and usage guidelines.
+
+
+"""
+
+SUFFIX = """
+If asked about the database structure, table design, or unavailable data, respond politely:
+*"I can answer questions from this database but cannot provide information about its structure or column names. Let me assist you with the data instead."*
+
+### Additional Guidelines:
+1. Always validate queries against user intent:
+   - Prioritize **relevance and accuracy**.
+   - Use domain-specific filtering for improved results (e.g., filtering by `pocategory_id` for purchase order categories).
+2. Incorporate prompt optimization techniques:
+   - Break down **complex questions** into smaller SQL components to ensure accuracy.
+   - Apply **logical conditions** (e.g., combining multiple filters using `AND` or `OR`) for precise results.
+3. Handle ambiguity:
+   - Clarify the query if needed.
+   - Make reasonable assumptions based on the schema and metadata.
+4. Optimize performance:
+   - Use indexed columns in filtering conditions to speed up queries.
+   - Aggregate results when large datasets are involved (e.g., using `SUM()`, `AVG()`, `GROUP BY`).
+
+5. Present answers effectively:
+   - Use **Markdown** tables with proper column headers and alignments.
+   - Provide **concise summaries** when large datasets are returned.
+
+6. For handling big result data:
+   - The result is too large to display. Please refine your query or use filters to reduce the result size to show the `top ten` results only.
+
+"""
+
+# The single view the agent answers questions from
+TABLE_NAME = "Vw_Ai_Tbl_PO_PurchaseOrders_Invoices_Details"
+
+# Keywords that route a question to a metadata group; the embedding classifier covers the rest
+METADATA_KEYWORDS = {
+    "Vessel Details": ("vessel", "vessels", "ship", "ships"),
+    "Invoice Details": ("invoice", "invoices", "invoiced", "vat", "tax", "currency", "due", "paid",
+                        "payment", "payments", "exchange rate", "discount", "advance"),
+    "Purchase Order Details": ("po", "pos", "purchase", "purchases", "order", "orders", "lead days"),
+    "Requisition and Approval Details": ("requisition", "requisitions", "enquiry", "enquiries", "quote",
+                                         "quotes", "quotation", "approval", "approved"),
+    "Goods Receipt Note (GRN) Details": ("grn", "grns", "goods", "receipt", "receipts", "received",
+                                         "delivery", "deliveries"),
+    "Item and Quantity Details": ("item", "items", "quantity", "quantities", "qty", "uom", "stock",
+                                  "reconditioned"),
+    "Port Details": ("port", "ports", "unlocode", "locode"),
+    "Financial Details": ("total", "totals", "amount", "amounts", "spend", "spent", "cost", "price",
+                          "value", "account", "accounts", "usd"),
+    "Vendor Details": ("vendor", "vendors", "supplier", "suppliers", "bank", "iban", "swift"),
+}
+
+# Column metadata is sent per question, limited to the groups relevant to it
+METADATA_GROUPS = split_metadata_groups(METADATA_GROUPINGS)
+METADATA_DESCRIPTION = METADATA_GROUPINGS[:METADATA_GROUPINGS.index("#### ")]
+
+# The static part of the system prompt is frozen to the same bytes on every request so
+# OpenAI's automatic prompt caching can reuse it; per-question metadata and user input follow it
+FROZEN_PREFIX = (PREFIX + SUFFIX).format_map({"dialect": DIALECT, "top_k": TOP_K})
+SYSTEM_MESSAGE = SystemMessage(content=FROZEN_PREFIX)
+
+# Part of the shared cache key: hashes everything that shapes an answer (prompt text, column
+# metadata and its routing, table schema and models), so a change to any of them starts a fresh cache
+def prompt_version(table_info) -> str:
+    parts = [FROZEN_PREFIX, METADATA_GROUPINGS, repr(sorted(METADATA_KEYWORDS.items())),
+             table_info or "", LLM_MODEL, EMBEDDING_MODEL]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:12]
+
+# Used to confirm that a near-duplicate cached question really asks for the same data
+SAME_QUESTION_PROMPT = """Do these two questions ask for exactly the same data? Answer only "yes" or "no".
+1. {first}
+2. {second}"""
+
+
+# Initialize FastAPI application; responses are encoded with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Lowercase, replace punctuation with spaces and collapse whitespace so equivalent
+# questions share a cache key; the model still receives the question as written
+_PUNCT_RE = re.compile(r"[-_,.]+")
+_WS_RE = re.compile(r"\s+")
+
+def normalize(query: str) -> str:
+    return _WS_RE.sub(" ", _PUNCT_RE.sub(" ", query.lower())).strip()
+
+# Bare greetings are answered directly instead of going through the model
+_GREETING_SET = frozenset({
+    "hi", "hello", "hey", "hiya", "howdy", "greetings", "yo",
+    "hi there", "hello there", "hey there",
+    "good morning", "good afternoon", "good evening", "good day",
+    "how are you", "how are you doing", "hi how are you", "hello how are you", "hey how are you",
+    "whats up", "what's up", "sup",
+})
+GREETING_RESPONSE = "Hello! How can I assist you today?"
+
+# Introspect the table schema once so neither the prompt nor the schema tool has to query it again
+def load_table_info(db: SQLDatabase):
     try:
-        db = SingletonSQLDatabase.get_instance()  # Get the singleton database instance
-        db.run("SELECT 1")  # Execute a simple query to keep the connection alive
-        logging.info("Database connection kept alive.")
-    except Exception as e:
-        logging.error("Error in keep_connection_alive:", exc_info=True)
-
-# Initialize APScheduler
-scheduler = BackgroundScheduler()
-
-# Schedule the keep_connection_alive task to run every 10 seconds
-scheduler.add_job(keep_connection_alive, 'interval', seconds=999999)
-
-# Function to get the database connection via dependency injection
-def get_db_connection():
-    db = SingletonSQLDatabase.get_instance()
-    return db
+        return db.get_table_info([TABLE_NAME])
+    except ValueError:
+        logger.warning("Table %s not found; schema will be looked up per request.", TABLE_NAME)
+        return None
+
+# Build the toolkit, prompt and SQL agent once and share them across requests
+def build_agent_executor(llm: ChatOpenAI, db: SQLDatabase, table_info=None):
+    # Create the prompt and messages; the user query is filled into {input} per request
+    messages = [SYSTEM_MESSAGE]
+    # Queries are capped at TOP_K rows and checked for DML before they reach the database;
+    # a cached schema is served from sql_db_schema and kept in the static part of the prompt
+    toolkit = InvoiceSQLDatabaseToolkit(llm=llm, db=db, top_k=TOP_K, table_name=TABLE_NAME, table_info=table_info)
+    if table_info is not None:
+        messages.append(SystemMessage(content=f"Schema of the `{TABLE_NAME}` table:\n{table_info}"))
+    messages += [
+        SystemMessagePromptTemplate.from_template(METADATA_DESCRIPTION + "{column_metadata}"),
+        HumanMessagePromptTemplate.from_template("{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ]
+
+    prompt = ChatPromptTemplate.from_messages(messages)
+    return create_sql_agent(llm, toolkit=toolkit, agent_type="openai-tools", verbose=False, prompt=prompt)
+
+# Look up a cached response for a question that is worded slightly differently
+async def find_similar_response(query: str, embedding: list):
+    score, cached_query, cached_response = app.state.response_cache.search(embedding)
+    if score >= SIMILARITY_HIT:
+        return cached_response
+    if score >= SIMILARITY_VERIFY:
+        verdict = await app.state.llm.ainvoke(SAME_QUESTION_PROMPT.format(first=cached_query, second=query))
+        if verdict.content.strip().lower().startswith("yes"):
+            return cached_response
+    return None
+
+# Run the agent on the question as written, with only the metadata groups relevant to it
+async def run_agent(question: str, query: str, embedding: list) -> str:
+    metadata_router = app.state.metadata_router
+    column_metadata = metadata_router.render(metadata_router.select(query, embedding))
+    # Execute the query without blocking the event loop
+    result = await app.state.agent_executor.ainvoke({"input": question, "column_metadata": column_metadata})
+    return result["output"]
 
 # The main query handler function
 @app.post("/query/")
-async def handle_query(userinput: ModelInput, db: SQLDatabase = Depends(get_db_connection)) -> Dict:
-    
-    try:
-        # Initialize OpenAI LLM
-        llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0,
-            streaming=True,
-            verbose=False,
-            openai_api_key=openai_api_key
-        )
+async def handle_query(userinput: ModelInput) -> Dict:
+    # Only the question text reaches the model, never the request model itself
+    query = normalize(userinput.user_query or "")
+    if not query:
+        raise HTTPException(status_code=422, detail="user_query must not be empty.")
+
+    if query.rstrip("!? ") in _GREETING_SET:
+        return {"response": GREETING_RESPONSE}
 
-        # Initialize the SQLDatabaseToolkit with LLM and the database
-        
-        toolkit = SQLDatabaseToolkit(llm=llm, db=db)
-        dialect = toolkit.dialect
-        top_k = 10
-
-        # Construct the prompt with the provided user input
-        column_metadata = """
-
-        **Description:**
-        This table contains cleansed and structured item data for equipment and parts used in various systems. It provides detailed information on item descriptions, specifications, manufacturer details, and unique identifiers to ensure accurate item tracking and data integrity.
-
-        **Columns Metadata:**
-
-        - **vessel_id**: Unique identifier for the vessel.
-        - **vessel_object_id**: Internal object identifier for the vessel in the system.
-        - **Vessel_Name**: Name of the vessel associated with the purchase order or invoice.
-        - **Invoice_Id**: Unique identifier for the invoice.
-        - **Inv_Title**: Title or description of the invoice.
-        - **Inv_Code**: Unique code assigned to the invoice.
-        - **VENDOR_INVOICE_DATE**: Date the vendor issued the invoice.
-        - **INVOICE_CURRENCY_ID**: Unique identifier for the currency used in the invoice.
-        - **Invoice_Currency_Name**: Name of the currency used in the invoice (e.g., US Dollar, Euro).
-        - **Invoice_Currency_Code**: ISO currency code (e.g., USD, EUR) for the invoice.
-        - **EXG_RATE_VESSEL_CURRENCY**: Exchange rate to convert the invoice currency into the vessel's operating currency.
-        - **EXG_RATE_GROUP_CURRENCY**: Exchange rate to convert the invoice currency into the group's base currency.
-        - **REGISTRATION_DATE**: Date the invoice was registered in the system.
-        - **inv_approval_flag**: Indicates if the invoice has been approved (1 for approved, 0 for pending).
-        - **CASH_PO_INVOICE**: Indicates if the invoice is linked to a cash-based purchase order.
-        - **VENDOR_INVOICE_NO**: Unique number assigned to the invoice by the vendor.
-        - **PARTIAL_INVOICE**: Indicates if the invoice is a partial payment or installment (1 for partial).
-        - **PAID_ADV**: Amount of advance payment made against the invoice.
-        - **INVOICE_TYPE**: Type of invoice (e.g., Regular, Credit, Debit).
-        - **VAT_AMOUNT**: Value-added tax applied to the invoice.
-        - **INVOICE_AMOUNT**: Total amount of the invoice.
-        - **CASH_DISCOUNT**: Discount applied for early payment in cash.
-        - **PAY_DUE_DATE**: Due date for payment of the invoice.
-        - **INVOICE_YEAR**: Year the invoice was issued.
-        - **PAYMENT_DATE**: Date the invoice was paid.
-        - **Inv_Dt_Id**: Unique identifier for the invoice date.
-        - **Inv_Effective_Date**: Date when the invoice became effective (e.g., for accounting purposes).
-        - **Inv_Closed_Date**: Date the invoice was marked as closed.
-        - **total_invoice_currency**: Total invoice amount in the original invoice currency.
-        - **po_hd_Id**: Unique identifier for the purchase order header.
-        - **po_code**: Code for the purchase order.
-        - **created_date**: Date the purchase order was created.
-        - **po_dt_id**: Unique identifier for the purchase order details.
-        - **po_id**: Unique identifier for the purchase order.
-        - **po_quantity**: Quantity of items in the purchase order.
-        - **po_unit_price**: Unit price of items in the purchase order.
-        - **po_account_id**: Account identifier for the purchase order.
-        - **effective_date**: Effective date of the purchase order.
-        - **closed_date**: Date the purchase order was marked as closed.
-        - **lead_days**: Lead time in days for the purchase order.
-        - **requisition_dt_id**: Unique identifier for the requisition details.
-        - **enquiry_dt_id**: Unique identifier for the enquiry details.
-        - **quote_dt_id**: Unique identifier for the quote details.
-        - **approved_quote_dt_id**: Unique identifier for the approved quote details.
-        - **approval_list_id**: Unique identifier for the approval list.
-        - **sp_goods_receipt_id**: Unique identifier for the goods receipt note.
-        - **sp_goods_receipt_hd_code**: Header code for the goods receipt note.
-        - **grn_receipt_date**: Date the goods receipt was created.
-        - **grn_receipt_status**: Status of the goods receipt (e.g., Pending, Approved).
-        - **vendor_delivery_reference**: Vendor’s reference for the delivery associated with the invoice.
-        - **grn_remarks**: Remarks or notes about the goods receipt.
-        - **send_to_office**: Indicates whether the goods receipt is sent to the office.
-        - **goods_rcvd_approved_date**: Date the received goods were approved.
-        - **sp_goods_receipt_dt_id**: Unique identifier for the goods receipt date.
-        - **item_id**: Unique identifier for the item being purchased or invoiced.
-        - **uom_id**: Unit of measure for the item (e.g., KG, LTR, PCS).
-        - **received_qty**: Quantity of goods received from the vendor.
-        - **accepted_qty**: Quantity of goods accepted after inspection.
-        - **converted_stock_qty**: Quantity of goods added to inventory after conversion or repackaging.
-        - **normal_qty**: Standard quantity for the item in inventory.
-        - **reconditioned_qty**: Quantity of goods reconditioned for use.
-        - **port_id**: Unique identifier for the port.
-        - **port_name**: Name of the port.
-        - **port_code**: Code representing the port (e.g., for internal or system use).
-        - **port_unloccode**: UN/LOCODE for the port, used for international trade and transport.
-        - **ai_port_unloc_id**: AI-enhanced identifier combining the UN/LOCODE with system-specific details.
-        - **QUANTITY**: Quantity of the item involved in the transaction.
-        - **UNIT_PRICE**: Unit price of the item involved in the transaction.
-        - **ACCOUNT_ID**: Identifier for the account linked to the transaction.
-        - **ENTITY_ID**: Unique identifier for the entity associated with the transaction.
-        - **TOTAL_VESSEL_CURRENCY**: Total amount in the vessel's operating currency.
-        - **TOTAL_PO_CURRENCY**: Total amount in the purchase order's currency.
-        - **TOTAL_GROUP_CURRENCY**: Total amount in the group's base currency.
-        - **Inv_Account_Code**: Code representing the account linked to the invoice.
-        - **Inv_Account_Name**: Name of the account linked to the invoice.
-        - **Vendor**: Name of the vendor associated with the invoice.
-        - **Vendor_ID**: Unique identifier for the vendor.
-        - **Account_Number**: Account number associated with the vendor.
-        - **BANK_CODE**: Code of the bank where the vendor holds an account.
-        - **SWIFT_CODE**: SWIFT code for the vendor's bank.
-        - **IBAN**: IBAN (International Bank Account Number) for the vendor.
-
-        """
-        Metadata_Groupings= """
-        **Description:**
-        This table contains cleansed and structured item data for equipment and parts used in various systems. It provides detailed information on item descriptions, specifications, manufacturer details, and unique identifiers to ensure accurate item tracking and data integrity.
-
-        **Columns Metadata:**
-
-        ### Metadata Groupings
-
-        #### Invoice Details:
-        - **Invoice_Id**: Unique identifier for the invoice.
-        - **Inv_Title**: Title or description of the invoice.
-        - **Inv_Code**: Unique code assigned to the invoice.
-        - **VENDOR_INVOICE_DATE**: Date the vendor issued the invoice.
-        - **INVOICE_CURRENCY_ID**: Unique identifier for the currency used in the invoice.
-        - **Invoice_Currency_Name**: Name of the currency used in the invoice (e.g., US Dollar, Euro).
-        - **Invoice_Currency_Code**: ISO currency code (e.g., USD, EUR) for the invoice.
-        - **EXG_RATE_VESSEL_CURRENCY**: Exchange rate to convert the invoice currency into the vessel's operating currency.
-        - **EXG_RATE_GROUP_CURRENCY**: Exchange rate to convert the invoice currency into the group's base currency.
-        - **REGISTRATION_DATE**: Date the invoice was registered in the system.
-        - **inv_approval_flag**: Indicates if the invoice has been approved (1 for approved, 0 for pending).
-        - **VENDOR_INVOICE_NO**: Unique number assigned to the invoice by the vendor.
-        - **PARTIAL_INVOICE**: Indicates if the invoice is a partial payment or installment (1 for partial).
-        - **PAID_ADV**: Amount of advance payment made against the invoice.
-        - **INVOICE_TYPE**: Type of invoice (e.g., Regular, Credit, Debit).
-        - **VAT_AMOUNT**: Value-added tax applied to the invoice.
-        - **INVOICE_AMOUNT**: Total amount of the invoice.
-        - **CASH_DISCOUNT**: Discount applied for early payment in cash.
-        - **PAY_DUE_DATE**: Due date for payment of the invoice.
-        - **INVOICE_YEAR**: Year the invoice was issued.
-        - **PAYMENT_DATE**: Date the invoice was paid.
-        - **Inv_Dt_Id**: Unique identifier for the invoice date.
-        - **Inv_Effective_Date**: Date when the invoice became effective (e.g., for accounting purposes).
-        - **Inv_Closed_Date**: Date the invoice was marked as closed.
-        - **total_invoice_currency**: Total invoice amount in the original invoice currency.
-
-        #### Purchase Order Details:
-        - **po_hd_Id**: Unique identifier for the purchase order header.
-        - **po_code**: Code for the purchase order.
-        - **created_date**: Date the purchase order was created.
-        - **po_dt_id**: Unique identifier for the purchase order details.
-        - **po_id**: Unique identifier for the purchase order.
-        - **po_quantity**: Quantity of items in the purchase order.
-        - **po_unit_price**: Unit price of items in the purchase order.
-        - **po_account_id**: Account identifier for the purchase order.
-        - **effective_date**: Effective date of the purchase order.
-        - **closed_date**: Date the purchase order was marked as closed.
-        - **lead_days**: Lead time in days for the purchase order.
-
-        #### Requisition and Approval Details:
-        - **requisition_dt_id**: Unique identifier for the requisition details.
-        - **enquiry_dt_id**: Unique identifier for the enquiry details.
-        - **quote_dt_id**: Unique identifier for the quote details.
-        - **approved_quote_dt_id**: Unique identifier for the approved quote details.
-        - **approval_list_id**: Unique identifier for the approval list.
-
-        #### Goods Receipt Note (GRN) Details:
-        - **sp_goods_receipt_id**: Unique identifier for the goods receipt note.
-        - **sp_goods_receipt_hd_code**: Header code for the goods receipt note.
-        - **grn_receipt_date**: Date the goods receipt was created.
-        - **grn_receipt_status**: Status of the goods receipt (e.g., Pending, Approved).
-        - **vendor_delivery_reference**: Vendor’s reference for the delivery associated with the invoice.
-        - **grn_remarks**: Remarks or notes about the goods receipt.
-        - **send_to_office**: Indicates whether the goods receipt is sent to the office.
-        - **goods_rcvd_approved_date**: Date the received goods were approved.
-        - **sp_goods_receipt_dt_id**: Unique identifier for the goods receipt date.
-
-        #### Item and Quantity Details:
-        - **item_id**: Unique identifier for the item being purchased or invoiced.
-        - **uom_id**: Unit of measure for the item (e.g., KG, LTR, PCS).
-        - **received_qty**: Quantity of goods received from the vendor.
-        - **accepted_qty**: Quantity of goods accepted after inspection.
-        - **converted_stock_qty**: Quantity of goods added to inventory after conversion or repackaging.
-        - **normal_qty**: Standard quantity for the item in inventory.
-        - **reconditioned_qty**: Quantity of goods reconditioned for use.
-
-        #### Port Details:
-        - **port_id**: Unique identifier for the port.
-        - **port_name**: Name of the port.
-        - **port_code**: Code representing the port (e.g., for internal or system use).
-        - **port_unloccode**: UN/LOCODE for the port, used for international trade and transport.
-        - **ai_port_unloc_id**: AI-enhanced identifier combining the UN/LOCODE with system-specific details.
-
-        #### Financial Details:
-        - **QUANTITY**: Quantity of the item involved in the transaction.
-        - **UNIT_PRICE**: Unit price of the item involved in the transaction.
-        - **ACCOUNT_ID**: Identifier for the account linked to the transaction.
-        - **ENTITY_ID**: Unique identifier for the entity associated with the transaction.
-        - **TOTAL_VESSEL_CURRENCY**: Total amount in the vessel's operating currency.
-        - **TOTAL_PO_CURRENCY**: Total amount in the purchase order's currency.
-        - **TOTAL_GROUP_CURRENCY**: Total amount in the group's base currency.
-        - **Inv_Account_Code**: Code representing the account linked to the invoice.
-        - **Inv_Account_Name**: Name of the account linked to the invoice.
-
-        #### Vendor Details:
-        - **Vendor**: Name of the vendor associated with the invoice.
-        - **Vendor_ID**: Unique identifier for the vendor.
-        - **Account_Number**: Account number associated with the vendor.
-        - **BANK_CODE**: Code of the bank where the vendor holds an account.
-        - **SWIFT_CODE**: SWIFT code for the vendor's bank.
-        - **IBAN**: IBAN (International Bank Account Number) for the vendor.
-
-        """
-  
-       
-        prefix = """
-        You are an advanced SQL database assistant specializing in answering user queries by interacting with the `Vw_Ai_Tbl_PO_PurchaseOrders_Invoices_Details` table in the `Common` schema.
-        ### Handling General Queries:
-        - If the query is a general greeting (e.g., "Hi", "Hello", "How are you?"), respond with a polite acknowledgment:
-          - Example: "Hello! How can I assist you today?"
-        - For unrelated or unclear questions, politely guide the user back to database-specific queries.
-          - Example: "I'm here to assist with database-related queries. How can I help?"
-
-        ### Responsibilities:
-        1. Provide **precise** and **contextually relevant** answers strictly based on the specified table and schema.
-        2. Ensure **query normalization and standardization** to deliver consistent and meaningful results for similar questions.
-        3. Leverage response history to avoid redundant queries, optimizing efficiency and user satisfaction.
-        
-        ### Query Normalization Guidelines:
-        - **Input Transformation**: 
-        1.Convert all input text to lowercase for case-insensitive handling.
-        2.Replace punctuation characters (e.g., -, _, ,, .) with spaces for better uniformity.
-        3.Remove leading and trailing whitespaces; collapse multiple spaces into a single space.
-        - **String Functions**:
-        1.Use SQL string functions like `LOWER()`, `TRIM()`, `REPLACE()`, and fuzzy matching (`LIKE`, `LEVENSHTEIN()`, `SOUNDEX`) to account for minor spelling errors or variations.
-        - **Case Mismatch Handling**:
-        1.If the data in the database is stored in a specific case (e.g., uppercase), ensure that both the input and the database column are transformed to the same case during processing.
-        - **For consistent matching**: 
-        1.Normalize input to match the stored case (e.g., UPPER() for uppercase or LOWER() for lowercase).
-        2.Apply the same transformation on both sides of the comparison.
-        3.Use case-insensitive comparisons (e.g., ILIKE for PostgreSQL, collations in MySQL).
-        ### SQL Query Construction:
-        1. Ensure the query adheres to the **{dialect} dialect** syntax.
-        2. Use **specific columns** in the SELECT clause for precision; avoid `SELECT *`.
-        3. Apply **LIMIT {top_k}** unless the user explicitly specifies a different limit in their query. The value of `top_k` is dynamically set to **30** by default for this session, ensuring the response includes at most 30 results unless overridden by user input.
-        - If no explicit limit is mentioned in the query, default to **LIMIT {top_k}**, where `top_k=30` for this session.
-        - If the user explicitly specifies a `LIMIT` value, override the default `top_k` and use the user's provided value.
-        - Ensure every SQL query includes a `LIMIT` clause, either with the default `top_k` or as explicitly stated by the user.
-        - Priority for `LIMIT`:
-          1. Explicit value provided by the user.
-          2. Default value set to `top_k=30` for this session.
-        4. Order results by **relevant columns** for clarity (e.g., `ApprovedDate DESC` for recent approvals).
-        5. Validate query syntax before execution to ensure success and eliminate errors.
-        6. Incorporate conditions for **filtering by user intent** and domain-specific logic (e.g., fetching purchase orders for a particular `VesselName` or `SMC`).
-        7. When queried regarding **unique vendors**, the unique vendors are supposed to be calculated based on  **VENDOREMAIL**
-        8. Use the **PO_USD_VALUE** column for the questions regarding the purchase.
-        ### Rules of Engagement:
-        - Do not perform Data Manipulation Language (DML) operations such as `INSERT`, `UPDATE`, or `DELETE`.
-        - Use **Markdown format** for presenting results:
-          - Include bordered tables for tabular data for better readability.
-        - If the query is unrelated to the database or cannot be addressed, respond with:
-          *"I'm unable to provide an answer for that. This information is not available."*
-        - Handle ambiguous questions by:
-          1. Politely clarifying the user's intent.
-          2. Assuming the most logical interpretation when clarification isn't feasible.
-        - **Tone and Style**:
-          - Be professional, concise, and courteous in responses.
-          - Avoid database-specific jargon unless directly relevant.
-          - Use the following metadata {column_metadata} and {Metadata_Groupings}
-        
-        Your ultimate goal is to ensure clarity, accuracy, and user satisfaction while adhering strictly to data access and usage guidelines.
-
-
-        """
-        
-       
-
-        
-        suffix = """
-        If asked about the database structure, table design, or unavailable data, respond politely:
-        *"I can answer questions from this database but cannot provide information about its structure or column names. Let me assist you with the data instead."*
-        
-        ### Additional Guidelines:
-        1. Always validate queries against user intent:
-           - Prioritize **relevance and accuracy**.
-           - Use domain-specific filtering for improved results (e.g., filtering by `pocategory_id` for purchase order categories).
-        2. Incorporate prompt optimization techniques:
-           - Break down **complex questions** into smaller SQL components to ensure accuracy.
-           - Apply **logical conditions** (e.g., combining multiple filters using `AND` or `OR`) for precise results.
-        3. Handle ambiguity:
-           - Clarify the query if needed.
-           - Make reasonable assumptions based on the schema and metadata.
-        4. Optimize performance:
-           - Use indexed columns in filtering conditions to speed up queries.
-           - Aggregate results when large datasets are involved (e.g., using `SUM()`, `AVG()`, `GROUP BY`).
-        
-        5. Present answers effectively:
-           - Use **Markdown** tables with proper column headers and alignments.
-           - Provide **concise summaries** when large datasets are returned.
-
-        6. For handling big result data:
-           - The result is too large to display. Please refine your query or use filters to reduce the result size to show the `top ten` results only.
-
-        """
-        
-        # Create the prompt and messages
-        human_message = HumanMessagePromptTemplate.from_template("{input}").format(input=userinput)
-        messages = [
-            SystemMessage(content=prefix),
-            human_message,
-            AIMessage(content=suffix),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ]
-
-        prompt = ChatPromptTemplate.from_messages(messages)
-        agent_executor = create_sql_agent(llm, db=db, agent_type="openai-tools", verbose=True, prompt=prompt)
-
-        # Execute the query
-        response = agent_executor.invoke(f"Now answer this query: {userinput}")["output"]
+    try:
+        response_cache = app.state.response_cache
+
+        # Serve repeated questions from the cache before falling back to the agent
+        response = response_cache.get(query)
+        if response is not None:
+            return {"response": response}
+        redis_cache = app.state.redis_cache
+        if redis_cache is not None:
+            # Redis hits are not copied into the local tier, which would restart their TTL
+            response = await redis_cache.get(query)
+            if response is not None:
+                return {"response": response}
+        embedding = await app.state.embeddings.aembed_query(query)
+        # Similar-question hits are not stored again, which would restart their TTL
+        response = await find_similar_response(query, embedding)
+        if response is not None:
+            return {"response": response}
+
+        # Only answers the agent actually produced are cached
+        response = await run_agent(userinput.user_query.strip(), query, embedding)
+        response_cache.put(query, embedding, response)
+        if redis_cache is not None:
+            await redis_cache.put(query, response)
         return {"response": response}
     except Exception as e:
-        logging.error("Error handling query:", exc_info=True)
+        logger.error("Error handling query: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         raise HTTPException(status_code=500, detail="An error occurred while processing the request.")
 
 # Basic endpoint for testing
@@ -374,12 +410,56 @@ async def handle_query(userinput: ModelInput, db: SQLDatabase = Depends(get_db_c
 def read_root():
     return {"message": "Welcome to my FastAPI app!"}
 
-# Start the scheduler on app startup
+# Build the shared database, LLM, SQL agent, response cache and metadata router on app startup
 @app.on_event("startup")
 async def startup():
-    scheduler.start()
+    # Fail fast instead of erroring on the first request
+    if not openai_api_key:
+        raise RuntimeError("openai_api_key is not set")
+    # One pooled HTTP/2 client shared by every OpenAI call, so connections and TLS sessions are reused
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+    app.state.llm = ChatOpenAI(
+        model=LLM_MODEL,
+        temperature=0,
+        streaming=False,
+        verbose=False,
+        openai_api_key=openai_api_key,
+        # Set on the models: their default of None overrides any timeout on the shared client
+        request_timeout=OPENAI_TIMEOUT,
+        http_async_client=app.state.http_client,
+    )
+    app.state.embeddings = OpenAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        openai_api_key=openai_api_key,
+        request_timeout=OPENAI_TIMEOUT,
+        http_async_client=app.state.http_client,
+    )
+    app.state.db = SingletonSQLDatabase.get_instance()
+    table_info = load_table_info(app.state.db)
+    app.state.agent_executor = build_agent_executor(app.state.llm, app.state.db, table_info)
+    app.state.response_cache = ResponseCache(ttl=CACHE_TTL)
+    app.state.redis_cache = None
+    if redis_url:
+        app.state.redis_cache = RedisResponseCache(
+            redis.from_url(
+                redis_url,
+                decode_responses=False,
+                socket_timeout=REDIS_TIMEOUT,
+                socket_connect_timeout=REDIS_TIMEOUT,
+            ),
+            prompt_version(table_info),
+            ttl=CACHE_TTL,
+        )
+    app.state.metadata_router = MetadataRouter(METADATA_GROUPS, METADATA_KEYWORDS)
+    await app.state.metadata_router.load_embeddings(app.state.embeddings)
 
-# Shutdown the scheduler on app shutdown
+# Close the shared HTTP and Redis clients and flush queued logs on app shutdown
 @app.on_event("shutdown")
 async def shutdown():
-    scheduler.shutdown()
+    await app.state.http_client.aclose()
+    if app.state.redis_cache is not None:
+        await app.state.redis_cache.close()
+    log_listener.stop()
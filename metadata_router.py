@@ -0,0 +1,67 @@
+import re
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+# Group headings in the metadata text look like "#### Invoice Details:"
+_HEADING_RE = re.compile(r"^#### (.+?):?\s*$", re.MULTILINE)
+# Keywords are matched on word tokens so surrounding punctuation never hides them
+_WORD_RE = re.compile(r"\w+")
+
+# Minimum cosine similarity for the embedding classifier to trust its best match
+MIN_SIMILARITY = 0.30
+# Groups scoring within this margin of the best match are included as well
+SIMILARITY_MARGIN = 0.05
+
+
+def split_metadata_groups(metadata: str) -> Dict[str, str]:
+    """Split grouped column metadata into {heading: block}, preserving order."""
+    matches = list(_HEADING_RE.finditer(metadata))
+    groups = {}
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(metadata)
+        groups[match.group(1)] = metadata[match.start():end].strip()
+    return groups
+
+
+class MetadataRouter:
+    """Selects the metadata groups relevant to a question.
+
+    Keyword hits and an embedding similarity against one precomputed vector per
+    group are combined; when neither is confident every group is returned.
+    """
+
+    def __init__(self, groups: Dict[str, str], keywords: Dict[str, Sequence[str]]):
+        self.groups = groups
+        self.keywords = keywords
+        self._headings = list(groups)
+        self._vectors: Optional[np.ndarray] = None
+
+    async def load_embeddings(self, embeddings) -> None:
+        """Embed each group once so requests only need the query embedding."""
+        vectors = np.asarray(await embeddings.aembed_documents(list(self.groups.values())), dtype=np.float32)
+        self._vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def select(self, query: str, embedding: Optional[List[float]] = None) -> List[str]:
+        """Return the headings of the groups relevant to a normalized query."""
+        # Rejoining the tokens lets multi-word keywords such as "exchange rate" match too
+        padded = f" {' '.join(_WORD_RE.findall(query))} "
+        selected = {
+            heading for heading in self._headings
+            if any(f" {keyword} " in padded for keyword in self.keywords.get(heading, ()))
+        }
+        if embedding is not None and self._vectors is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            scores = self._vectors @ (vector / np.linalg.norm(vector))
+            best = float(scores.max())
+            if best >= MIN_SIMILARITY:
+                selected.update(
+                    heading for heading, score in zip(self._headings, scores)
+                    if score >= best - SIMILARITY_MARGIN
+                )
+        if not selected:
+            return list(self._headings)
+        return [heading for heading in self._headings if heading in selected]
+
+    def render(self, headings: List[str]) -> str:
+        """Join the selected groups back into prompt text."""
+        return "\n\n".join(self.groups[heading] for heading in headings)
@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+import orjson
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Similarity above which a cached answer is returned as-is
+SIMILARITY_HIT = 0.97
+# Similarity above which a cached answer is returned only after the LLM confirms the questions match
+SIMILARITY_VERIFY = 0.90
+
+
+class ResponseCache:
+    """Two-tier in-process cache of agent responses keyed on the normalized user query.
+
+    The first tier is an exact match on the query hash; the second is a flat cosine
+    search over the embeddings of the most recent queries. Entries in both tiers
+    expire after `ttl` seconds so answers over live data do not go stale.
+    """
+
+    def __init__(self, maxsize: int = 4096, max_vectors: int = 1024, ttl: int = 3600):
+        self._ttl = ttl
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl, timer=time.monotonic)
+        self._max_vectors = max_vectors
+        self._vectors: Optional[np.ndarray] = None
+        self._stored_at = np.zeros(max_vectors, dtype=np.float64)
+        self._entries: List[Tuple[str, str]] = []
+        self._next = 0
+
+    @staticmethod
+    def make_key(query: str) -> str:
+        """Hash a normalized query into a cache key."""
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+    def get(self, query: str) -> Optional[str]:
+        """Return the cached response for an exact query match, if any."""
+        return self._exact.get(self.make_key(query))
+
+    def search(self, embedding: List[float]) -> Tuple[float, Optional[str], Optional[str]]:
+        """Return (similarity, cached query, cached response) for the closest unexpired query."""
+        if not self._entries:
+            return 0.0, None, None
+        size = len(self._entries)
+        scores = self._vectors[:size] @ self._unit(embedding)
+        # Expired entries stay in the ring buffer until overwritten but never match
+        scores[self._stored_at[:size] < time.monotonic() - self._ttl] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            return 0.0, None, None
+        query, response = self._entries[best]
+        return float(scores[best]), query, response
+
+    def put(self, query: str, embedding: List[float], response: str) -> None:
+        """Store a response under both the exact key and the query embedding."""
+        self._exact[self.make_key(query)] = response
+        vector = self._unit(embedding)
+        if self._vectors is None:
+            self._vectors = np.zeros((self._max_vectors, vector.shape[0]), dtype=np.float32)
+        # Ring buffer: once full, the oldest query is overwritten
+        self._vectors[self._next] = vector
+        self._stored_at[self._next] = time.monotonic()
+        if self._next < len(self._entries):
+            self._entries[self._next] = (query, response)
+        else:
+            self._entries.append((query, response))
+        self._next = (self._next + 1) % self._max_vectors
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class RedisResponseCache:
+    """Exact-match response cache shared by every worker and replica through Redis.
+
+    Keys include the prompt version so a prompt change never serves stale answers.
+    Redis errors are logged and treated as cache misses.
+    """
+
+    KEY_PREFIX = "sqlagent:"
+    LOOKUPS_KEY = "sqlagent:stats:lookups"
+    HITS_KEY = "sqlagent:stats:hits"
+
+    def __init__(self, client, prompt_version: str, ttl: int = 3600):
+        self._client = client
+        self._prompt_version = prompt_version
+        self._ttl = ttl
+
+    def make_key(self, query: str) -> str:
+        """Hash a normalized query and the prompt version into a Redis key."""
+        digest = hashlib.sha256((query + self._prompt_version).encode("utf-8")).hexdigest()
+        return self.KEY_PREFIX + digest
+
+    async def get(self, query: str) -> Optional[str]:
+        """Return the shared cached response for a query, if any."""
+        try:
+            # Fetch the value and count the lookup in a single round trip
+            async with self._client.pipeline(transaction=False) as pipe:
+                pipe.get(self.make_key(query))
+                pipe.incr(self.LOOKUPS_KEY)
+                value, _ = await pipe.execute()
+            if value is None:
+                return None
+            await self._client.incr(self.HITS_KEY)
+            return orjson.loads(value)
+        except Exception as e:
+            logger.warning("Redis cache lookup failed: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            return None
+
+    async def put(self, query: str, response: str) -> None:
+        """Store a response with the configured TTL."""
+        try:
+            await self._client.setex(self.make_key(query), self._ttl, orjson.dumps(response))
+        except Exception as e:
+            logger.warning("Redis cache store failed: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+
+    async def close(self) -> None:
+        """Close the underlying Redis connection pool."""
+        await self._client.aclose()
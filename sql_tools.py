@@ -0,0 +1,96 @@
+from typing import List, Optional
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import InfoSQLDatabaseTool, QuerySQLDataBaseTool
+
+# Read-only commands sqlglot only parses as a generic Command
+_READ_ONLY_COMMANDS = frozenset({"SHOW"})
+# Nodes that make an otherwise read-only query write to the database
+_WRITE_TYPES = (exp.DML, exp.DDL, exp.Command)
+
+READ_ONLY_ERROR = "Error: Only read-only queries (SELECT, DESCRIBE, SHOW) are allowed."
+
+
+def is_read_only(statement: exp.Expression) -> bool:
+    """Allowlist check: plain queries, DESCRIBE and SHOW are the only statements the agent may run."""
+    if isinstance(statement, exp.Query):
+        return statement.find(*_WRITE_TYPES) is None
+    if isinstance(statement, exp.Describe):
+        return True
+    return isinstance(statement, exp.Command) and str(statement.this).upper() in _READ_ONLY_COMMANDS
+
+
+class CachedInfoSQLDatabaseTool(InfoSQLDatabaseTool):
+    """`sql_db_schema` tool that answers from a schema string captured at startup."""
+
+    table_name: str
+    table_info: str
+
+    def _run(
+        self,
+        table_names: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        requested = {name.strip().lower() for name in table_names.split(",") if name.strip()}
+        if requested == {self.table_name.lower()}:
+            return self.table_info
+        # Anything other than the cached table still goes to the database
+        return super()._run(table_names, run_manager)
+
+
+class BoundedQuerySQLDataBaseTool(QuerySQLDataBaseTool):
+    """`sql_db_query` tool that runs only read-only statements and caps unbounded queries at `top_k` rows."""
+
+    dialect: str
+    top_k: int
+
+    def _run(
+        self,
+        query: str,
+        run_manager: Optional[CallbackManagerForToolRun] = None,
+    ) -> str:
+        try:
+            statements = [statement for statement in sqlglot.parse(query, read=self.dialect) if statement]
+        except SqlglotError as e:
+            # SQL that cannot be checked is never sent; the agent gets the error to correct its query
+            return f"Error: Could not parse the SQL query: {e}"
+        if not statements or not all(is_read_only(statement) for statement in statements):
+            return READ_ONLY_ERROR
+        if len(statements) == 1 and isinstance(statements[0], exp.Query) and not statements[0].args.get("limit"):
+            query = statements[0].limit(self.top_k).sql(dialect=self.dialect)
+        return super()._run(query, run_manager)
+
+
+class InvoiceSQLDatabaseToolkit(SQLDatabaseToolkit):
+    """SQLDatabaseToolkit with a bounded query tool and, when given, a precomputed table schema.
+
+    Queries are parsed in the database's own dialect (`self.dialect`).
+    """
+
+    top_k: int
+    table_name: Optional[str] = None
+    table_info: Optional[str] = None
+
+    def get_tools(self) -> List[BaseTool]:
+        tools = []
+        for tool in super().get_tools():
+            if isinstance(tool, QuerySQLDataBaseTool):
+                tool = BoundedQuerySQLDataBaseTool(
+                    db=self.db,
+                    description=tool.description,
+                    dialect=self.dialect,
+                    top_k=self.top_k,
+                )
+            elif isinstance(tool, InfoSQLDatabaseTool) and self.table_info is not None:
+                tool = CachedInfoSQLDatabaseTool(
+                    db=self.db,
+                    description=tool.description,
+                    table_name=self.table_name,
+                    table_info=self.table_info,
+                )
+            tools.append(tool)
+        return tools